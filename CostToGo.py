@@ -0,0 +1,367 @@
+import hashlib
+import itertools
+import multiprocessing
+import os
+import tempfile
+
+import numpy as np
+
+from sim.SimManager import SimManager
+
+
+# Shared by the worker processes, set once by _init_worker so the successor
+# table is not pickled again for every target
+_worker_context = {}
+
+
+def _init_worker(successors, weights, state_positions, table_path, gamma,
+                 action_repeat, max_iter, tolerance):
+    """
+    Initializer of the solver processes
+
+    :param successors np.array: Indices of the grid states around the next
+    state for each (action, state), shape (n_actions, 4, n_states)
+    :param weights np.array: Interpolation weights of these grid states
+    :param state_positions np.array: Ball position of each state, shape
+    (n_states, 2)
+    :param table_path str: The file where the tables are written
+    :param gamma float: The discount factor
+    :param action_repeat int: Amount of physic steps per decision
+    :param max_iter int: Maximum amount of value iteration sweeps
+    :param tolerance float: Stop the sweeps when the values move less than
+    this fraction of their maximum
+    """
+    _worker_context.update(successors=successors,
+                           weights=weights,
+                           state_positions=state_positions,
+                           table_path=table_path,
+                           gamma=gamma,
+                           action_repeat=action_repeat,
+                           max_iter=max_iter,
+                           tolerance=tolerance)
+
+
+def _solve_targets(task):
+    """
+    Value iteration over the whole grid for a row of targets at once, the
+    values of every target of a state are contiguous so each interpolation
+    gathers whole rows. The result is directly written in the memory-mapped
+    table
+
+    :param task tuple: The row index in the target grid and the target
+    positions of this row, shape (n_target, 2)
+    """
+    row_idx, target_positions = task
+    ctx = _worker_context
+    successors = ctx["successors"]
+    weights = ctx["weights"]
+
+    costs = ctx["action_repeat"] * np.linalg.norm(
+        ctx["state_positions"][:, None] - target_positions, axis=-1)
+    costs = costs.astype(np.float32)
+
+    values = np.zeros_like(costs)
+    for _ in range(ctx["max_iter"]):
+        best_next_values = None
+        for action_successors, action_weights in zip(successors, weights):
+            next_values = 0
+            for corner_successors, corner_weights in zip(action_successors,
+                                                         action_weights):
+                next_values = (next_values +
+                               values[corner_successors] *
+                               corner_weights[:, None])
+            if best_next_values is None:
+                best_next_values = next_values
+            else:
+                np.minimum(best_next_values, next_values,
+                           out=best_next_values)
+
+        new_values = costs + ctx["gamma"] * best_next_values
+        delta = np.abs(new_values - values).max()
+        values = new_values
+        if delta < ctx["tolerance"] * values.max():
+            break
+
+    table = np.load(ctx["table_path"], mmap_mode="r+")
+    table[row_idx] = values.T.reshape(table.shape[1:])
+    table.flush()
+    del table
+
+    return row_idx
+
+
+class CostToGo:
+    def __init__(self,
+                 map_size,
+                 phy_dt,
+                 n_pos=32,
+                 n_speed=15,
+                 n_target=16,
+                 max_speed=300.,
+                 action_repeat=5,
+                 gamma=0.99,
+                 max_iter=2000,
+                 tolerance=1e-4,
+                 cache_dir="cost_to_go_cache"):
+        """
+        Optimal cost-to-go table of the simulation computed by value iteration
+        over a discretised grid of (position, speed) for each target cell of a
+        discretised grid of targets. The cost of a decision is action_repeat
+        times the distance to the target at the start of the decision, an
+        approximation of the sum of the per-step distances given as reward by
+        SimMagnetEnv, which are measured after each physic step.
+        The next states are snapped to the nearest position cell but
+        interpolated between the speed cells, otherwise the small speed changes
+        of a single decision would be rounded away.
+        The tables are cached on disk and memory-mapped once built.
+
+        :param map_size list[int]: The size of the simulation (!= screen_size)
+        :param phy_dt float: The time step of the simulation
+        :param n_pos int: Amount of cells per axis for the ball position
+        :param n_speed int: Amount of cells per axis for the ball speed (odd to
+        have a null speed cell)
+        :param n_target int: Amount of cells per axis for the target position
+        :param max_speed float: Speeds are clipped to [-max_speed, max_speed]
+        :param action_repeat int: Amount of physic steps a decision lasts, it
+        must be big enough for the ball to leave its cell otherwise the grid
+        can't see it moving
+        :param gamma float: The discount factor
+        :param max_iter int: Maximum amount of value iteration sweeps
+        :param tolerance float: Stop the sweeps when the values move less than
+        this fraction of their maximum
+        :param cache_dir str: The directory where the tables are cached
+        """
+        self.map_size = np.array(map_size, dtype=float)
+        self.phy_dt = phy_dt
+        self.n_pos = n_pos
+        self.n_speed = n_speed
+        self.n_target = n_target
+        self.max_speed = max_speed
+        self.action_repeat = action_repeat
+        self.gamma = gamma
+        self.max_iter = max_iter
+        self.tolerance = tolerance
+        self.cache_dir = cache_dir
+
+        # Dummy sim_manager to get the same magnets as the environment
+        self.logic = SimManager(list(self.map_size), [0, 0], False).logic
+        n_magnets = len(self.logic.magnets)
+        self.actions = np.array(list(itertools.product([0, 1],
+                                                       repeat=n_magnets)))
+
+        self.pos_step = self.map_size / n_pos
+        self.speed_step = 2 * max_speed / (n_speed - 1)
+        self.target_step = self.map_size / n_target
+
+        self.table = None
+
+    def _get_cache_path(self):
+        """
+        Path of the cached table, named after everything the values depend on
+        """
+        params = (tuple(self.map_size),
+                  self.phy_dt,
+                  self.n_pos,
+                  self.n_speed,
+                  self.n_target,
+                  self.max_speed,
+                  self.action_repeat,
+                  self.gamma,
+                  self.max_iter,
+                  self.tolerance,
+                  self.logic.friction,
+                  tuple(map(tuple, (m.position for m in self.logic.magnets))),
+                  tuple(m.unit_strength for m in self.logic.magnets),
+                  tuple(m.max_magnet_strength for m in self.logic.magnets))
+        key = hashlib.sha1(repr(params).encode()).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f"cost_to_go_{key}.npy")
+
+    def _get_grid_states(self):
+        """
+        Positions and speeds at the center of every cell of the grid, the
+        states are flattened in (x, y, vx, vy) order
+        """
+        pos_x = (np.arange(self.n_pos) + 0.5) * self.pos_step[0]
+        pos_y = (np.arange(self.n_pos) + 0.5) * self.pos_step[1]
+        speeds = np.linspace(-self.max_speed, self.max_speed, self.n_speed)
+
+        grid = np.meshgrid(pos_x, pos_y, speeds, speeds, indexing="ij")
+        grid = np.stack([axis.ravel() for axis in grid], axis=-1)
+
+        return grid[:, :2], grid[:, 2:]
+
+    def _get_state_interpolation(self, positions, speeds):
+        """
+        Flat indices of the 4 grid states surrounding each state in speed, in
+        the nearest position cell, and their bilinear interpolation weights
+
+        :param positions np.array: The ball positions, shape (n, 2)
+        :param speeds np.array: The ball speeds, shape (n, 2)
+        """
+        pos_idx = np.clip((positions // self.pos_step).astype(int),
+                          0, self.n_pos - 1)
+
+        speed_coords = np.clip((speeds + self.max_speed) / self.speed_step,
+                               0, self.n_speed - 1)
+        speed_low = np.minimum(speed_coords.astype(int), self.n_speed - 2)
+        speed_frac = speed_coords - speed_low
+
+        indices = []
+        weights = []
+        for dx, dy in itertools.product([0, 1], repeat=2):
+            indices.append(np.ravel_multi_index((pos_idx[:, 0],
+                                                 pos_idx[:, 1],
+                                                 speed_low[:, 0] + dx,
+                                                 speed_low[:, 1] + dy),
+                                                (self.n_pos, self.n_pos,
+                                                 self.n_speed, self.n_speed)))
+            weights.append(np.where(dx, speed_frac[:, 0], 1 - speed_frac[:, 0]) *
+                           np.where(dy, speed_frac[:, 1], 1 - speed_frac[:, 1]))
+
+        return np.stack(indices, axis=-1), np.stack(weights, axis=-1)
+
+    def _get_target_index(self, target_pos):
+        """
+        Index of the nearest target cell
+
+        :param target_pos list[float]: The goal position
+        """
+        target_idx = np.clip((np.array(target_pos) //
+                              self.target_step).astype(int),
+                             0, self.n_target - 1)
+        return tuple(target_idx)
+
+    def _simulate(self, positions, speeds, activities):
+        """
+        Run the physic for the whole duration of a decision
+
+        :param positions np.array: The ball positions, shape (n, 2)
+        :param speeds np.array: The ball speeds, shape (n, 2)
+        :param activities np.array: The magnets activities
+        """
+        for _ in range(self.action_repeat):
+            positions, speeds = self.logic.batch_update_phy(positions,
+                                                            speeds,
+                                                            activities,
+                                                            self.phy_dt)
+        return positions, speeds
+
+    def _compute_successors(self):
+        """
+        Next grid states of every grid state for every action, the dynamics
+        don't depend on the target so this is shared by every table
+        """
+        positions, speeds = self._get_grid_states()
+        shape = (len(self.actions), 4, len(positions))
+        successors = np.empty(shape, dtype=np.int32)
+        weights = np.empty(shape, dtype=np.float32)
+
+        for action_idx, activities in enumerate(self.actions):
+            next_pos, next_speeds = self._simulate(positions,
+                                                   speeds,
+                                                   activities)
+            indices, corner_weights = self._get_state_interpolation(
+                next_pos, next_speeds)
+            successors[action_idx] = indices.T
+            weights[action_idx] = corner_weights.T
+
+        return successors, weights, positions
+
+    def build(self, n_workers=None):
+        """
+        Compute the tables of every target and write them to the cache, the
+        rows of targets are solved in parallel.
+        Every build writes to its own temporary file so that concurrent builds
+        of the same table don't write over each other
+
+        :param n_workers int: Amount of processes, every core if None
+        """
+        cache_path = self._get_cache_path()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_fd, tmp_path = tempfile.mkstemp(suffix=".tmp.npy",
+                                            dir=self.cache_dir)
+        os.close(tmp_fd)
+
+        try:
+            shape = (self.n_target, self.n_target,
+                     self.n_pos, self.n_pos,
+                     self.n_speed, self.n_speed)
+            table = np.lib.format.open_memmap(tmp_path,
+                                              mode="w+",
+                                              dtype=np.float32,
+                                              shape=shape)
+            del table
+
+            successors, weights, positions = self._compute_successors()
+            target_coords = np.arange(self.n_target) + 0.5
+            tasks = [(i, np.stack([np.full(self.n_target, target_coords[i]),
+                                   target_coords], axis=-1) * self.target_step)
+                     for i in range(self.n_target)]
+
+            with multiprocessing.Pool(n_workers,
+                                      initializer=_init_worker,
+                                      initargs=(successors,
+                                                weights,
+                                                positions,
+                                                tmp_path,
+                                                self.gamma,
+                                                self.action_repeat,
+                                                self.max_iter,
+                                                self.tolerance)) as pool:
+                for _ in pool.imap_unordered(_solve_targets, tasks):
+                    pass
+
+            os.replace(tmp_path, cache_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def load(self, n_workers=None):
+        """
+        Memory-map the cached tables, build them first if they are not cached
+
+        :param n_workers int: Amount of processes used if a build is needed
+        """
+        cache_path = self._get_cache_path()
+        if not os.path.exists(cache_path):
+            self.build(n_workers)
+        self.table = np.load(cache_path, mmap_mode="r")
+
+        return self
+
+    def get_cost(self, ball_pos, ball_speed, target_pos):
+        """
+        Optimal cost-to-go of the current state
+
+        :param ball_pos list[float]: The current ball position
+        :param ball_speed list[float]: The current ball speed
+        :param target_pos list[float]: The goal position
+        """
+        indices, weights = self._get_state_interpolation(
+            np.array([ball_pos], dtype=float),
+            np.array([ball_speed], dtype=float))
+        values = self.table[self._get_target_index(target_pos)].ravel()
+
+        return float((values[indices[0]] * weights[0]).sum())
+
+    def get_optimal_activities(self, ball_pos, ball_speed, target_pos):
+        """
+        Baseline controller, greedy one decision lookahead on the table from
+        the exact current state
+
+        :param ball_pos list[float]: The current ball position
+        :param ball_speed list[float]: The current ball speed
+        :param target_pos list[float]: The goal position
+        """
+        n_actions = len(self.actions)
+        positions = np.tile(np.array(ball_pos, dtype=float), (n_actions, 1))
+        speeds = np.tile(np.array(ball_speed, dtype=float), (n_actions, 1))
+
+        next_pos, next_speeds = self._simulate(positions,
+                                               speeds,
+                                               self.actions)
+        values = self.table[self._get_target_index(target_pos)].ravel()
+        indices, weights = self._get_state_interpolation(next_pos, next_speeds)
+        next_values = (values[indices] * weights).sum(axis=-1)
+
+        return self.actions[np.argmin(next_values)]
@@ -8,7 +8,13 @@ from sim.SimManager import SimManager
 
 
 class SimMagnetEnv(gym.Env):
-    def __init__(self, map_size, phy_dt, with_render):
+    def __init__(self,
+                 map_size,
+                 phy_dt,
+                 with_render,
+                 cost_to_go=None,
+                 shaping_weight=1.,
+                 shaping_gamma=0.99):
         """
         Gym environment for the magnet simulation
 
@@ -16,11 +22,31 @@ class SimMagnetEnv(gym.Env):
         :param phy_dt float: The time step of the simulation
         :param with_render bool: Activate the rendering of the simulation or not
         to save computations
+        :param cost_to_go CostToGo: Loaded cost-to-go table used to add a
+        potential-based shaping term to the reward, no shaping if None. It must
+        be built with the same map_size and phy_dt as this environment
+        :param shaping_weight float: Scale of the shaping term
+        :param shaping_gamma float: Discount of the shaping term, must equal the
+        learner's discount otherwise the optimal policies are changed
         """
         self.phy_dt = phy_dt
         self.with_render = with_render
         self.map_size = map_size
 
+        if cost_to_go is not None:
+            if (cost_to_go.phy_dt != phy_dt or
+                    not np.array_equal(cost_to_go.map_size, map_size)):
+                raise ValueError("cost_to_go was built for another map_size or "
+                                 "phy_dt than this environment")
+            if cost_to_go.table is None:
+                raise ValueError("cost_to_go table is not loaded, call "
+                                 "cost_to_go.load() first")
+
+        self.cost_to_go = cost_to_go
+        self.shaping_weight = shaping_weight
+        self.shaping_gamma = shaping_gamma
+        self.potential = 0.
+
         self.observation_space = spaces.Box(low=-250,
                                             high=800,
                                             shape=(6,),
@@ -71,6 +97,7 @@ class SimMagnetEnv(gym.Env):
         self.n_step = 0
         self.valid_steps = 0
 
+        self.potential = self._get_potential(ball_pos, ball_speed, target_pos)
 
         return state, {}
 
@@ -99,7 +126,10 @@ class SimMagnetEnv(gym.Env):
 
         truncated = self.n_step >= self.max_steps
 
-        reward = self._compute_reward(target_pos, ball_pos)
+        reward = self._compute_reward(target_pos,
+                                      ball_pos,
+                                      ball_speed,
+                                      terminated)
 
         state = np.concatenate([ball_pos, ball_speed, target_pos])
 
@@ -138,19 +168,47 @@ class SimMagnetEnv(gym.Env):
             self.valid_steps = 0
 
 
-    def _compute_reward(self, target_pos, ball_pos):
+    def _get_potential(self, ball_pos, ball_speed, target_pos):
+        """
+        Potential of a state for the reward shaping, the opposite of its optimal
+        cost-to-go brought back to the scale of a single step
+
+        :param ball_pos list[int]: The current ball position
+        :param ball_speed list[int]: The current ball speed
+        :param target_pos list[int]: The goal position
+        """
+        if self.cost_to_go is None:
+            return 0.
+        cost = self.cost_to_go.get_cost(ball_pos, ball_speed, target_pos)
+        return -self.shaping_weight * cost / self.cost_to_go.action_repeat
+
+    def _compute_reward(self, target_pos, ball_pos, ball_speed, terminated):
         """
         Compute the reward and add a penalty if the algorithm just stays on a
-        specific position
+        specific position.
+        If a cost-to-go table is given, a potential-based shaping term is added
+        which keeps the same optimal policies as long as shaping_gamma is the
+        discount of the learner. The potential of a terminal state is 0
 
         :param target_pos list[int]: The goal position
         :param ball_pos list[int]: The current ball position
+        :param ball_speed list[int]: The current ball speed
+        :param terminated bool: True if the episode ends on this step
         """
         reward = -np.linalg.norm(target_pos - ball_pos)
 
         if self.penalty_steps > self.penalty_steps_threshold:
             reward *= 2
 
+        if self.cost_to_go is not None:
+            potential = 0.
+            if not terminated:
+                potential = self._get_potential(ball_pos,
+                                                ball_speed,
+                                                target_pos)
+            reward += self.shaping_gamma * potential - self.potential
+            self.potential = potential
+
         return reward
 
     def render(self, mode="human"): # pyright: ignore return
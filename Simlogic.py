@@ -42,6 +42,24 @@ class SimMagnet():
 
         return mag_strength
 
+    def get_batch_mag_strength(self, ball_positions):
+        """
+        Vectorized version of get_mag_strength, computed as if the magnet was
+        activated for a whole batch of ball positions
+
+        :param ball_positions np.array: The ball positions, shape (n, 2)
+        """
+        epsilon = 1e-6
+        dist_sgd = self.position - ball_positions
+        dist_norm = np.linalg.norm(dist_sgd, axis=-1, keepdims=True)
+        unit_vector = dist_sgd / (dist_norm + epsilon)
+
+        mag_strength = self.unit_strength * unit_vector / (dist_norm ** 2 + epsilon)
+
+        return np.clip(mag_strength,
+                       -self.max_magnet_strength,
+                       self.max_magnet_strength)
+
     def set_activity(self, activity):
         """
         Setter function of the activity of the magnet
@@ -63,6 +81,7 @@ class SimLogic():
 
         self.ball_pos = self.map_size / 2
         self.ball_speed = np.array([0., 0.])
+        self.friction = 0.1
 
         self.magnets: list[SimMagnet] = [SimMagnet(mag_position)
                                          for mag_position in mag_positions]
@@ -72,12 +91,11 @@ class SimLogic():
         """
         Get the current acceleration of the ball
         """
-        friction = 0.1
         axlr = 0;
 
         for magnet in self.magnets:
             axlr += magnet.get_mag_strength(self.ball_pos)
-        axlr -= self.ball_speed * friction
+        axlr -= self.ball_speed * self.friction
 
         return axlr
 
@@ -158,3 +176,39 @@ class SimLogic():
                 self.ball_speed[1] *= -1
 
         self.ball_pos = hypo_pos
+
+    def batch_update_phy(self, positions, speeds, activities, dt):
+        """
+        Vectorized version of update_phy_ball used by the cost-to-go solver.
+        It does not touch the state of the simulation and returns the next
+        positions and speeds for a whole batch of balls
+
+        :param positions np.array: The ball positions, shape (n, 2)
+        :param speeds np.array: The ball speeds, shape (n, 2)
+        :param activities np.array: The magnets activities, shape (n, n_magnets)
+        or (n_magnets,) to apply the same activities to every ball
+        :param dt float: The time step of the simulation
+        """
+        activities = np.broadcast_to(activities,
+                                     (len(positions), len(self.magnets)))
+
+        axlr = -speeds * self.friction
+        for idx, magnet in enumerate(self.magnets):
+            axlr = axlr + (activities[:, idx:idx + 1] *
+                           magnet.get_batch_mag_strength(positions))
+
+        speeds = speeds + axlr * dt
+        hypo_pos = positions + speeds * dt
+
+        # Same bounces as update_phy_ball, the borders themselves are
+        # considered inside so that a ball lying on them can't loop forever
+        outside = (hypo_pos < 0) | (hypo_pos > self.map_size)
+        while outside.any():
+            hypo_pos = np.where(hypo_pos < 0, -hypo_pos, hypo_pos)
+            hypo_pos = np.where(hypo_pos > self.map_size,
+                                2 * self.map_size - hypo_pos,
+                                hypo_pos)
+            speeds = np.where(outside, -speeds, speeds)
+            outside = (hypo_pos < 0) | (hypo_pos > self.map_size)
+
+        return hypo_pos, speeds
@@ -0,0 +1,13 @@
+import os
+import sys
+import types
+
+
+# The modules import each other through the "sim" package, which is this
+# directory whatever its name on disk
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if "sim" not in sys.modules:
+    sim_package = types.ModuleType("sim")
+    sim_package.__path__ = [ROOT]
+    sys.modules["sim"] = sim_package
@@ -0,0 +1,26 @@
+import os
+
+import numpy as np
+
+from sim.CostToGo import CostToGo
+
+
+def test_cost_decreases_toward_target(tmp_path):
+    cost_to_go = CostToGo([400, 400],
+                          0.05,
+                          n_pos=8,
+                          n_speed=5,
+                          n_target=2,
+                          max_iter=200,
+                          cache_dir=str(tmp_path))
+    cost_to_go.load(n_workers=1)
+
+    assert cost_to_go.table.shape == (2, 2, 8, 8, 5, 5)
+    assert [p.name for p in tmp_path.iterdir()] == [
+        cost_to_go._get_cache_path().split(os.sep)[-1]]
+
+    target_pos = [100, 100]
+    costs = [cost_to_go.get_cost(ball_pos, [0, 0], target_pos)
+             for ball_pos in ([375, 375], [275, 275], [175, 175], [100, 100])]
+
+    assert all(far > near for far, near in zip(costs, costs[1:]))
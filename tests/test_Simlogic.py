@@ -0,0 +1,38 @@
+import numpy as np
+
+from sim.Simlogic import SimLogic
+
+
+def test_batch_update_phy_matches_update_phy_ball():
+    map_size = [500, 500]
+    mag_positions = np.array([[125, 125], [125, 375], [375, 125], [375, 375]])
+    logic = SimLogic(map_size, mag_positions)
+    dt = 0.05
+
+    rng = np.random.default_rng(0)
+    positions = rng.random((64, 2)) * 500
+    speeds = (rng.random((64, 2)) - 0.5) * 2000
+    activities = rng.integers(0, 2, (64, 4))
+    # Balls next to the borders going out to check the bounces
+    positions[:4] = [[1, 250], [499, 250], [250, 1], [250, 499]]
+    speeds[:4] = [[-500, 0], [500, 0], [0, -500], [0, 500]]
+
+    batch_pos, batch_speeds = positions, speeds
+    for _ in range(5):
+        batch_pos, batch_speeds = logic.batch_update_phy(batch_pos,
+                                                         batch_speeds,
+                                                         activities,
+                                                         dt)
+
+    for idx in range(len(positions)):
+        logic.ball_pos = positions[idx].copy()
+        logic.ball_speed = speeds[idx].copy()
+        logic.set_magnets_activity_logic(activities[idx])
+        for _ in range(5):
+            logic.update_phy_ball(dt)
+
+        np.testing.assert_allclose(logic.get_ball_pos(), batch_pos[idx])
+        np.testing.assert_allclose(logic.get_ball_speed(), batch_speeds[idx])
+
+    assert batch_speeds[0, 0] > 0 and batch_speeds[1, 0] < 0
+    assert batch_speeds[2, 1] > 0 and batch_speeds[3, 1] < 0